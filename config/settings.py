@@ -10,6 +10,17 @@ USER_AGENT = (
 )
 REQUEST_TIMEOUT = 10
 
+# Number of worker processes used to clean pages in bulk mode (None = CPU count)
+CLEAN_WORKERS = None
+
+# Fetched pages that bulk mode may still be cleaning in worker processes while
+# it waits out the delay and fetches the next page (0 = clean inline, no pool).
+# Pages are still requested at most once per delay
+BULK_PAGES_AHEAD = 2
+
+# Pre-filter pages with selectolax when it is installed (pip install ".[fast]")
+USE_SELECTOLAX = True
+
 # Output settings
 OUTPUT_DIR = "docs"
 MAX_FILENAME_LENGTH = 100
@@ -5,15 +5,25 @@ Scrapes content from PvZ Fandom wiki and creates clean, offline-accessible HTML
 """
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
+import os
 import sys
 import argparse
 import time
 import urllib.parse
 import json
+import lxml.html
 import yaml
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional "fast" extra; fall back to lxml
+    LexborHTMLParser = None
+
 
 # Import our modules
 from utils.content_processor import ContentProcessor
@@ -35,10 +45,136 @@ def load_content_types():
         return {"plants": []}
 
 
+def _css_selector(tag, selector):
+    """Convert a settings selector (tag name or attribute dict) into CSS"""
+    if not isinstance(selector, dict):
+        return selector
+    return tag + "".join(
+        f'[{attr}~="{value}"]' if attr == "class" else f'[{attr}="{value}"]'
+        for attr, value in selector.items()
+    )
+
+
+# UNWANTED_SELECTORS pruned early by the selectolax path. clean_content
+# applies the full list again, so sibling-combinator selectors are left out:
+# once the first match is gone, a second pass would match the next sibling
+_PREPRUNE_SELECTOR = ", ".join(
+    selector
+    for selector in settings.UNWANTED_SELECTORS
+    if "+" not in selector and "~" not in selector
+)
+
+
+def parse_page_fast(html):
+    """Locate the title and main content with selectolax and prune unwanted nodes
+
+    Only the pruned main content is handed to BeautifulSoup, so the slow
+    Python tree is never built for the rest of the page.
+    """
+    tree = LexborHTMLParser(html)
+
+    title = "PvZ Wiki Page"
+    for selector in settings.TITLE_SELECTORS:
+        title_node = tree.css_first(_css_selector("h1", selector))
+        if title_node is not None:
+            title = title_node.text().strip()
+            break
+
+    for selector in settings.MAIN_CONTENT_SELECTORS:
+        main_node = tree.css_first(_css_selector("div", selector))
+        if main_node is not None:
+            break
+    else:
+        print("Warning: Could not find main content area")
+        return title, None
+
+    # Remove in reverse document order so descendants go before their ancestors
+    for element in reversed(main_node.css(_PREPRUNE_SELECTOR)):
+        element.decompose()
+
+    return title, BeautifulSoup(main_node.html, "lxml").find("div")
+
+
+def _xpath_selector(tag, selector):
+    """Convert a settings selector (tag name or attribute dict) into XPath"""
+    if not isinstance(selector, dict):
+        return f"//{selector}"
+    return f"//{tag}" + "".join(
+        (
+            f"[contains(concat(' ', normalize-space(@class), ' '), ' {value} ')]"
+            if attr == "class"
+            else f"[@{attr}='{value}']"
+        )
+        for attr, value in selector.items()
+    )
+
+
+def parse_page_lxml(html):
+    """Locate the title and main content with lxml
+
+    Used when selectolax is not installed. BeautifulSoup then builds only the
+    main content subtree, so the slow Python tree is never built for the page
+    chrome around it. The subtree is parsed from the page source rather than
+    serialized by lxml, whose HTML serializer percent-escapes non-ASCII
+    characters in href and src.
+    """
+    tree = lxml.html.document_fromstring(html)
+
+    title = "PvZ Wiki Page"
+    for selector in settings.TITLE_SELECTORS:
+        title_nodes = tree.xpath(_xpath_selector("h1", selector))
+        if title_nodes:
+            title = title_nodes[0].text_content().strip()
+            break
+
+    for selector in settings.MAIN_CONTENT_SELECTORS:
+        main_nodes = tree.xpath(_xpath_selector("div", selector))
+        if main_nodes:
+            break
+    else:
+        print("Warning: Could not find main content area")
+        return title, None
+
+    main_only = SoupStrainer("div", attrs=selector)
+    return title, BeautifulSoup(html, "lxml", parse_only=main_only).find("div")
+
+
+def clean_page(html, content_type, content_processor):
+    """Parse fetched HTML and return (title, main_content_html, sidebar_content_html)"""
+    if settings.USE_SELECTOLAX and LexborHTMLParser is not None:
+        title, main_content = parse_page_fast(html)
+    else:
+        title, main_content = parse_page_lxml(html)
+
+    if not main_content:
+        print("Failed to extract main content")
+        return title, None, None
+
+    main_content_html, sidebar_content_html = content_processor.clean_content(
+        main_content, content_type
+    )
+    return title, main_content_html, sidebar_content_html
+
+
+# Content processor owned by each cleaning worker process
+_worker_content_processor = None
+
+
+def _init_clean_worker():
+    """Create the per-process content processor for cleaning workers"""
+    global _worker_content_processor
+    _worker_content_processor = ContentProcessor()
+
+
+def _clean_page_in_worker(html, content_type):
+    """Clean a fetched page inside a worker process"""
+    return clean_page(html, content_type, _worker_content_processor)
+
+
 class PvZWikiScraper:
     """Main scraper class for PvZ Wiki content"""
 
-    def __init__(self):
+    def __init__(self, refresh_images=False):
         self.session = requests.Session()
         self.session.headers.update({"User-Agent": settings.USER_AGENT})
         self.output_dir = Path(settings.OUTPUT_DIR)
@@ -50,7 +186,10 @@ class PvZWikiScraper:
 
         self.content_processor = ContentProcessor()
         self.image_downloader = ImageDownloader(
-            self.session, self.output_dir, "https://pvz.fandom.com"
+            self.session,
+            self.output_dir,
+            "https://pvz.fandom.com",
+            revalidate=refresh_images,
         )
         self.template = self._load_template()
 
@@ -125,35 +264,6 @@ class PvZWikiScraper:
             print(f"Error fetching {url}: {e}")
             return None
 
-    def parse_content(self, html):
-        """Parse HTML and extract main article content"""
-        soup = BeautifulSoup(html, "lxml")
-
-        # Try different selectors for main content
-        for selector in settings.MAIN_CONTENT_SELECTORS:
-            main_content = soup.find("div", selector)
-            if main_content:
-                return main_content
-
-        print("Warning: Could not find main content area")
-        return None
-
-    def extract_title(self, html):
-        """Extract page title"""
-        soup = BeautifulSoup(html, "lxml")
-
-        # Try different title selectors
-        for selector in settings.TITLE_SELECTORS:
-            if isinstance(selector, dict):
-                title_tag = soup.find("h1", selector)
-            else:
-                title_tag = soup.find(selector)
-
-            if title_tag:
-                return title_tag.get_text().strip()
-
-        return "PvZ Wiki Page"
-
     def create_clean_html(
         self, title, main_content, sidebar_content="", content_type="plants"
     ):
@@ -225,26 +335,36 @@ class PvZWikiScraper:
         if not html:
             return False
 
-        # Extract title
-        title = self.extract_title(html)
+        # Extract title and clean main content
+        title, main_content_html, sidebar_content_html = clean_page(
+            html, content_type, self.content_processor
+        )
+        return self.save_page(
+            url,
+            content_type,
+            title,
+            main_content_html,
+            sidebar_content_html,
+            output_filename,
+        )
 
-        # Extract main content
-        main_content = self.parse_content(html)
-        if not main_content:
-            print("Failed to extract main content")
+    def save_page(
+        self,
+        url,
+        content_type,
+        title,
+        main_content_html,
+        sidebar_content_html,
+        output_filename=None,
+    ):
+        """Download images for cleaned content and write the final HTML page"""
+        if not main_content_html:
+            print("Failed to clean content")
             return False
 
         # Use the provided content type
         determined_content_type = content_type
 
-        # Clean and process content
-        main_content_html, sidebar_content_html = self.content_processor.clean_content(
-            main_content, determined_content_type
-        )
-        if not main_content_html:
-            print("Failed to clean content")
-            return False
-
         # Download and process images
         print("Processing images...")
         main_content_html = self.image_downloader.process_images_in_html(
@@ -302,6 +422,41 @@ class PvZWikiScraper:
         content_types = load_content_types()
         return content_types.get(content_type, [])
 
+    def _clean_page_inline(self, html, content_type):
+        """Clean a fetched page in this process and return it as a finished future"""
+        future = Future()
+        try:
+            future.set_result(clean_page(html, content_type, self.content_processor))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _save_bulk_page(self, content_type, total, i, url, expected_path, future):
+        """Wait for a page's cleaning to finish, then save it; returns success"""
+        try:
+            title, main_content_html, sidebar_content_html = future.result()
+        except Exception as e:
+            print(f"Error cleaning {url}: {e}")
+            success = False
+        else:
+            try:
+                success = self.save_page(
+                    url,
+                    content_type,
+                    title,
+                    main_content_html,
+                    sidebar_content_html,
+                )
+            except Exception as e:
+                print(f"Error saving {url}: {e}")
+                success = False
+
+        if success:
+            print(f"[{i}/{total}] ✅ Completed: {expected_path.name}")
+        else:
+            print(f"[{i}/{total}] ❌ Failed: {url}")
+        return success
+
     def scrape_bulk(self, content_type="plants", resume=False, delay=1.5):
         """Bulk download pages for a specific content type"""
         urls = self.get_content_urls(content_type)
@@ -317,33 +472,70 @@ class PvZWikiScraper:
         print(f"🚀 Starting bulk download: {total} {content_type} pages")
         print(f"📁 Output directory: {self.output_dir / content_type}")
 
-        for i, url in enumerate(urls, 1):
-            # Generate expected filename
-            expected_filename = self.generate_filename_from_url(url, content_type)
-            expected_path = self.output_dir / expected_filename
-
-            # Skip if file exists and resume mode is enabled
-            if resume and expected_path.exists():
-                print(f"[{i}/{total}] ⏭️  Skipping: {expected_path.name}")
-                skipped_count += 1
-                continue
-
-            print(f"\n[{i}/{total}] 📄 Processing: {url}")
-
-            # Scrape the page
-            success = self.scrape_page(url, content_type)
-
-            if success:
-                success_count += 1
-                print(f"[{i}/{total}] ✅ Completed: {expected_path.name}")
-            else:
-                failed_count += 1
-                print(f"[{i}/{total}] ❌ Failed: {url}")
-
-            # Rate limiting - be respectful to the server
-            if i < total:  # Don't delay after the last item
-                print(f"⏱️  Waiting {delay}s...")
-                time.sleep(delay)
+        # Pages are fetched one at a time, with the delay after every fetch, and
+        # saved in order as soon as they are cleaned. Up to BULK_PAGES_AHEAD
+        # pages are cleaned in worker processes during the following delays and
+        # fetches; at most that many plus the newest one are ever in flight,
+        # so no more workers than that are started. 0 cleans pages inline
+        pages_ahead = settings.BULK_PAGES_AHEAD
+        if pages_ahead > 0:
+            workers = min(settings.CLEAN_WORKERS or os.cpu_count(), pages_ahead + 1)
+            executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_clean_worker
+            )
+        else:
+            executor = nullcontext()
+
+        pending = deque()
+        with executor:
+            for i, url in enumerate(urls, 1):
+                # Generate expected filename
+                expected_filename = self.generate_filename_from_url(url, content_type)
+                expected_path = self.output_dir / expected_filename
+
+                # Skip if file exists and resume mode is enabled
+                if resume and expected_path.exists():
+                    print(f"[{i}/{total}] ⏭️  Skipping: {expected_path.name}")
+                    skipped_count += 1
+                    continue
+
+                print(f"\n[{i}/{total}] 📄 Processing: {url}")
+
+                # Fetch the page and hand it off for cleaning
+                html = self.fetch_page(url)
+                if html:
+                    if pages_ahead > 0:
+                        future = executor.submit(
+                            _clean_page_in_worker, html, content_type
+                        )
+                    else:
+                        future = self._clean_page_inline(html, content_type)
+                    pending.append((i, url, expected_path, future))
+                else:
+                    failed_count += 1
+                    print(f"[{i}/{total}] ❌ Failed: {url}")
+
+                # Save pages as soon as they are cleaned, in order, keeping at
+                # most BULK_PAGES_AHEAD fetched pages waiting to be saved
+                while pending and (
+                    len(pending) > pages_ahead or pending[0][3].done()
+                ):
+                    if self._save_bulk_page(content_type, total, *pending.popleft()):
+                        success_count += 1
+                    else:
+                        failed_count += 1
+
+                # Rate limiting - be respectful to the server
+                if i < total:  # Don't delay after the last item
+                    print(f"⏱️  Waiting {delay}s...")
+                    time.sleep(delay)
+
+            # Save the pages still being cleaned
+            while pending:
+                if self._save_bulk_page(content_type, total, *pending.popleft()):
+                    success_count += 1
+                else:
+                    failed_count += 1
 
         # Summary report
         print("\n📊 Bulk download complete!")
@@ -374,6 +566,8 @@ Examples:
   python scraper.py --zombies                # Download zombies explicitly
   python scraper.py --all --resume           # Skip existing files
   python scraper.py --plants --delay 2       # Custom delay between requests
+  python scraper.py --all --refresh-images   # Re-check cached images for changes
+  python scraper.py --verify-images          # Rebuild image content hashes
         """,
     )
 
@@ -408,6 +602,16 @@ Examples:
         default=0.1,
         help="Delay between requests in seconds (default: 0.1)",
     )
+    parser.add_argument(
+        "--refresh-images",
+        action="store_true",
+        help="Re-check cached images with conditional requests and update changed ones",
+    )
+    parser.add_argument(
+        "--verify-images",
+        action="store_true",
+        help="Re-hash downloaded images and rebuild the content hash cache",
+    )
 
     return parser
 
@@ -442,7 +646,12 @@ def main():
 
     # Parse modern command line arguments
     args = parser.parse_args()
-    scraper = PvZWikiScraper()
+    scraper = PvZWikiScraper(refresh_images=args.refresh_images)
+
+    if args.verify_images:
+        scraper.image_downloader.verify_cache()
+        if not (args.all or args.plants or args.zombies or args.url):
+            return
 
     # Determine mode and execute
     if args.all:
@@ -4,6 +4,10 @@ Converts traditional Chinese to simplified Chinese using OpenCC
 """
 
 import opencc
+import re
+
+# Runs of non-ASCII characters; markup, URLs and ASCII text never need conversion
+_NON_ASCII_RUN_RE = re.compile(r"[^\x00-\x7f]+")
 
 
 class ChineseTranslator:
@@ -37,8 +41,10 @@ class ChineseTranslator:
             return html_content
 
         try:
-            # Convert the entire HTML content
-            simplified_html = self.converter.convert(html_content)
+            # Convert only the non-ASCII runs instead of the entire HTML content
+            simplified_html = _NON_ASCII_RUN_RE.sub(
+                lambda match: self.converter.convert(match.group()), html_content
+            )
             print("🈲 Converted traditional Chinese to simplified Chinese")
             return simplified_html
         except Exception as e:
@@ -2,10 +2,102 @@
 Content processing utilities for PvZ Wiki Scraper
 """
 
-from bs4 import BeautifulSoup
+from bs4 import Comment
 from config import settings
 from .chinese_translator import ChineseTranslator
+import functools
 import re
+import soupsieve
+import urllib.parse
+
+# CSS selectors compiled once at import; selector lists are joined so each
+# is matched in a single tree walk
+_UNWANTED_SELECTOR = soupsieve.compile(", ".join(settings.UNWANTED_SELECTORS))
+_SIDEBAR_SELECTOR = soupsieve.compile(", ".join(settings.SIDEBAR_SELECTORS))
+_FIGURE_SVG_SELECTOR = soupsieve.compile("figure.thumb svg")
+_FIGURE_INFO_ICON_SELECTOR = soupsieve.compile("figure.thumb .info-icon")
+_FIGURE_CAPTION_LINK_SELECTOR = soupsieve.compile("figure.thumb figcaption a")
+_PORTABLE_INFOBOX_SELECTOR = soupsieve.compile("aside.portable-infobox")
+_PI_TITLE_SELECTOR = soupsieve.compile("h2.pi-title")
+_TABBER_SELECTOR = soupsieve.compile("section.wds-tabber")
+_TAB_LABEL_SELECTOR = soupsieve.compile("div.wds-tabs__tab-label")
+_TAB_CONTENT_SELECTOR = soupsieve.compile("div.wds-tab__content")
+_PI_DATA_SELECTOR = soupsieve.compile("div.pi-data")
+_PI_LABEL_SELECTOR = soupsieve.compile("h3.pi-data-label")
+_PI_VALUE_SELECTOR = soupsieve.compile("div.pi-data-value")
+
+# Heading tags that delimit wiki sections, mapped to their level
+_HEADING_LEVELS = {f"h{level}": level for level in range(1, 7)}
+
+# Heading tags that end a section started by a heading of the given level
+_SECTION_END_TAGS = {
+    level: frozenset(tag for tag, other in _HEADING_LEVELS.items() if other <= level)
+    for level in _HEADING_LEVELS.values()
+}
+
+# Marker joining main and sidebar HTML so both are translated in one call
+_SIDEBAR_SEPARATOR = "<!--pvz-wiki-scraper:sidebar-->"
+
+# Anchors that may point at wiki pages, so unrelated links are never visited
+_WIKI_LINK_SELECTOR = soupsieve.compile(
+    'a[href^="/zh/wiki/"], a[href^="/wiki/"], a[href*="fandom.com"][href*="/wiki/"]'
+)
+
+# Class-name patterns for the fallback lookups that match several classes
+_INFOBOX_FALLBACK_RE = re.compile(r"infobox|pi-item")
+_TITLE_ALT_RE = re.compile(r"pi-title|infobox-title")
+_PAGE_TITLE_RE = re.compile(r"page-header__title|firstHeading")
+
+# Keywords found in MediaWiki performance and debug comments
+_MEDIAWIKI_COMMENT_KEYWORDS = [
+    "NewPP limit report",
+    "Transclusion expansion time report",
+    "Saved in parser cache",
+    "CPU time usage:",
+    "Real time usage:",
+    "Preprocessor visited node count:",
+    "Template argument size:",
+    "Lua time usage:",
+    "Lua memory usage:",
+]
+_MEDIAWIKI_COMMENT_RE = re.compile(
+    "|".join(map(re.escape, _MEDIAWIKI_COMMENT_KEYWORDS))
+)
+
+# Titles of the sections whose TOC entries are dropped along with the section
+_REMOVED_SECTION_TITLES = ("衍生内容", "图库")
+
+# Characters that mark an infobox field as a name field
+_NAME_CHARS_RE = re.compile("[名英中文日]")
+
+# Maximum number of distinct page names kept in the wiki link caches
+WIKI_LINK_CACHE_SIZE = 4096
+
+# Characters dropped from page names when deriving filenames; \w covers the
+# same Unicode letters and digits as str.isalnum() plus the underscore
+_DISALLOWED_FILENAME_CHARS_RE = re.compile(r"[^\w \-「」]")
+
+
+@functools.lru_cache(maxsize=WIKI_LINK_CACHE_SIZE)
+def _sanitize_page_name_for_filename(page_name):
+    """Sanitize page name to match the filename generation logic"""
+    # Use the same character filtering as generate_filename_from_url
+    return _DISALLOWED_FILENAME_CHARS_RE.sub("", page_name).strip()
+
+
+@functools.lru_cache(maxsize=WIKI_LINK_CACHE_SIZE)
+def _local_href_for_page(page_name):
+    """Map a decoded wiki page name to the href of its local HTML file"""
+    # Special case: Convert "植物大战僵尸" links to index.html
+    if page_name == "植物大战僵尸":
+        return "./index.html"
+    # Special case: Redirect "橄榄球僵尸（在线试玩）" to "暗黑橄榄球僵尸"
+    if page_name == "橄榄球僵尸（在线试玩）":
+        return "./暗黑橄榄球僵尸.html"
+    # Sanitize page name to match filename generation
+    sanitized_name = _sanitize_page_name_for_filename(page_name)
+    # Convert to local HTML file
+    return f"./{sanitized_name}.html"
 
 
 class ContentProcessor:
@@ -16,17 +108,18 @@ class ContentProcessor:
         self.translator = ChineseTranslator()
 
     def clean_content(self, content_soup, content_type="plants"):
-        """Remove unwanted elements and clean up the content"""
+        """Remove unwanted elements and clean up the content
+
+        The given soup is cleaned in place rather than copied, so callers
+        should not reuse it afterwards.
+        """
         if not content_soup:
             return None, None
 
-        # Make a copy to avoid modifying the original
-        cleaned = BeautifulSoup(str(content_soup), "lxml")
+        cleaned = content_soup
 
         # Remove unwanted elements (keep navbox and infoboxes)
-        for selector in settings.UNWANTED_SELECTORS:
-            for element in cleaned.select(selector):
-                element.decompose()
+        self._decompose_all(_UNWANTED_SELECTOR.select(cleaned))
 
         # Additional content filtering improvements
         self._apply_content_filters(cleaned)
@@ -34,9 +127,13 @@ class ContentProcessor:
         # Convert internal wiki links to local HTML files
         self._convert_wiki_links(cleaned)
 
-        # Remove empty paragraphs and divs (but preserve divs with images)
+        # Remove empty paragraphs and divs (but preserve divs with images).
+        # stripped_strings stops at the first text node instead of joining
+        # the text of the whole subtree
         for tag in cleaned.find_all(["p", "div"]):
-            if not tag.get_text(strip=True):
+            if tag.decomposed:
+                continue
+            if next(tag.stripped_strings, None) is None:
                 # Don't remove divs that contain images, even if they have no text
                 if tag.name == "div" and tag.find("img"):
                     continue
@@ -46,94 +143,106 @@ class ContentProcessor:
         sidebar_content = self._create_enhanced_infobox(cleaned, content_type)
 
         # Remove processed infobox elements from main content
-        for selector in settings.SIDEBAR_SELECTORS:
-            for element in cleaned.select(selector):
-                element.decompose()
+        self._decompose_all(_SIDEBAR_SELECTOR.select(cleaned))
 
         main_content = str(cleaned)
 
-        # Convert traditional Chinese to simplified Chinese
-        main_content = self.translator.convert_html(main_content)
-        sidebar_content = self.translator.convert_html(sidebar_content)
+        # Convert traditional Chinese to simplified Chinese in a single call
+        converted = self.translator.convert_html(
+            main_content + _SIDEBAR_SEPARATOR + sidebar_content
+        )
+        main_content, _, sidebar_content = converted.rpartition(_SIDEBAR_SEPARATOR)
 
         return main_content, sidebar_content
 
+    def _decompose_all(self, elements):
+        """Decompose elements, skipping ones already removed with an ancestor"""
+        for element in elements:
+            if not element.decomposed:
+                element.decompose()
+
     def _apply_content_filters(self, soup):
-        """Apply specific content filtering improvements"""
+        """Apply specific content filtering improvements
+
+        The tree is walked once to collect the hatnotes, headings, navbars,
+        TOC and comments the filters need, rather than each filter searching
+        it again.
+        """
+        hatnotes = []
+        headings = []
+        navbars = []
+        comments = []
+        toc = None
+        for element in soup.descendants:
+            name = element.name
+            if name is None:
+                if isinstance(element, Comment):
+                    comments.append(element)
+                continue
+            if name in _HEADING_LEVELS:
+                headings.append(element)
+            elif toc is None and name == "div" and element.get("id") == "toc":
+                toc = element
+            classes = element.get("class", ())
+            if "hatnote" in classes:
+                hatnotes.append(element)
+            if "navbar" in classes:
+                navbars.append(element)
 
         # 1. Remove .hatnote sections (disambiguation notes)
-        for hatnote in soup.find_all(class_="hatnote"):
-            hatnote.decompose()
+        self._decompose_all(hatnotes)
+
+        # Heading text is read by several filters, so extract it only once
+        heading_texts = {
+            id(heading): heading.get_text(strip=True) for heading in headings
+        }
 
         # 2. Filter out "衍生内容" (Derivative Content) sections
-        self._remove_section_by_title(soup, "衍生内容")
+        self._remove_section_by_title(headings, heading_texts, "衍生内容")
 
         # 3. Remove "图库" (Gallery) sections
-        self._remove_section_by_title(soup, "图库")
+        self._remove_section_by_title(headings, heading_texts, "图库")
 
         # 4. In "参见" (See Also) sections, remove .navbar div
-        self._clean_see_also_section(soup)
+        self._clean_see_also_section(headings, heading_texts, navbars)
 
         # 5. Remove SVG icons from figure captions
         self._remove_svg_icons(soup)
 
         # 6. Clean up TOC entries for removed sections
-        self._clean_toc_entries(soup)
+        if toc is not None and not toc.decomposed:
+            self._clean_toc_entries(toc)
 
         # 7. Remove MediaWiki performance comments
-        self._remove_mediawiki_comments(soup)
-
-    def _sanitize_page_name_for_filename(self, page_name):
-        """Sanitize page name to match the filename generation logic"""
-        # Use the same character filtering as generate_filename_from_url
-        allowed_chars = (" ", "-", "_", "「", "」")
-        safe_name = "".join(
-            c for c in page_name if c.isalnum() or c in allowed_chars
-        ).strip()
-        return safe_name
+        self._remove_mediawiki_comments(comments)
 
     def _process_wiki_link(self, link, page_name):
         """Process a wiki link by mapping page name to local href and adding wiki-link class"""
-        import urllib.parse
-
-        # URL decode the page name
-        page_name = urllib.parse.unquote(page_name)
-
-        # Special case: Convert "植物大战僵尸" links to index.html
-        if page_name == "植物大战僵尸":
-            local_href = "./index.html"
-        # Special case: Redirect "橄榄球僵尸（在线试玩）" to "暗黑橄榄球僵尸"
-        elif page_name == "橄榄球僵尸（在线试玩）":
-            local_href = "./暗黑橄榄球僵尸.html"
-        else:
-            # Sanitize page name to match filename generation
-            sanitized_name = self._sanitize_page_name_for_filename(page_name)
-            # Convert to local HTML file
-            local_href = f"./{sanitized_name}.html"
+        # URL decode the page name; most hrefs arrive already decoded
+        if "%" in page_name:
+            page_name = urllib.parse.unquote(page_name)
 
+        local_href = _local_href_for_page(page_name)
         link["href"] = local_href
 
-        # Add a class to indicate it's a local wiki link
-        existing_class = link.get("class", [])
-        if isinstance(existing_class, str):
-            existing_class = [existing_class]
-        existing_class.append("wiki-link")
-        link["class"] = existing_class
+        # Add a class to indicate it's a local wiki link; the lxml builder
+        # always parses class as a list, so it can be extended in place
+        classes = link.get("class") or []
+        classes.append("wiki-link")
+        link["class"] = classes
 
     def _convert_wiki_links(self, soup):
         """Convert internal wiki links to local HTML files"""
-        import urllib.parse
-
-        for link in soup.find_all("a"):
-            href = link.get("href", "")
+        for link in _WIKI_LINK_SELECTOR.select(soup):
+            href = link["href"]
 
             # Check if it's an internal wiki link
-            if href.startswith("/zh/wiki/") or href.startswith("/wiki/"):
+            if href.startswith(("/zh/wiki/", "/wiki/")):
                 # Extract the page name from the URL
                 page_name = href.split("/")[-1]
                 self._process_wiki_link(link, page_name)
 
-            elif "fandom.com" in href and "/wiki/" in href:
+            else:
                 # Handle full fandom URLs
                 # Extract page name from full URL
                 parsed = urllib.parse.urlparse(href)
@@ -144,81 +253,76 @@ class ContentProcessor:
             # For external links, we can leave them as-is or mark them
             # so they open in new tabs when viewed locally
 
-    def _remove_section_by_title(self, soup, section_title):
+    def _remove_section_by_title(self, headings, heading_texts, section_title):
         """Remove entire sections by their heading title"""
         # Look for headings that contain the section title
-        for heading in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-            if section_title in heading.get_text(strip=True):
+        for heading in headings:
+            if heading.decomposed:
+                continue
+            if section_title in heading_texts[id(heading)]:
                 # Find all content until the next heading of same or higher level
-                current_level = int(heading.name[1])  # Extract level number
-
-                # Collect all elements to remove
-                elements_to_remove = [heading]
+                end_tags = _SECTION_END_TAGS[_HEADING_LEVELS[heading.name]]
 
-                # Find all following siblings until next heading of same/higher level
+                # Remove following siblings until next heading of same/higher level
                 current = heading.next_sibling
-                while current:
+                while current is not None:
                     # Check if this is a heading of same or higher level
-                    if (
-                        hasattr(current, "name")
-                        and current.name
-                        and current.name.startswith("h")
-                        and len(current.name) == 2
-                        and int(current.name[1]) <= current_level
-                    ):
+                    if current.name in end_tags:
                         break
 
-                    # Add to removal list and move to next sibling
-                    elements_to_remove.append(current)
-                    current = current.next_sibling
-
-                # Remove all collected elements
-                for element in elements_to_remove:
-                    if hasattr(element, "decompose"):
-                        element.decompose()
-                    elif hasattr(element, "extract"):
-                        element.extract()
+                    # Grab the next sibling before this one is detached
+                    next_sibling = current.next_sibling
+                    if hasattr(current, "decompose"):
+                        current.decompose()
+                    else:
+                        current.extract()
+                    current = next_sibling
 
+                heading.decompose()
                 break
 
-    def _clean_see_also_section(self, soup):
+    def _clean_see_also_section(self, headings, heading_texts, navbars):
         """Clean the 参见 (See Also) section by removing .navbar divs and first ul"""
-        for heading in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-            heading_text = heading.get_text(strip=True)
+        if not navbars:
+            return
+
+        for heading in headings:
+            if heading.decomposed:
+                continue
+            heading_text = heading_texts[id(heading)]
             if (
                 "参见" in heading_text
                 or "另见" in heading_text
                 or "参考" in heading_text
             ):
-                # Find the next content until the next heading
-                current_level = int(heading.name[1])
+                # Collect the section's top-level elements up to the next heading
+                end_tags = _SECTION_END_TAGS[_HEADING_LEVELS[heading.name]]
+                section = set()
                 element = heading.next_sibling
-
-                while element:
-                    if (
-                        element.name
-                        and element.name.startswith("h")
-                        and len(element.name) == 2
-                        and int(element.name[1]) <= current_level
-                    ):
-                        break
-
-                    # Remove .navbar divs in this section
-                    if hasattr(element, "find_all"):
-                        for navbar in element.find_all(class_="navbar"):
-                            navbar.decompose()
-
+                while element is not None and element.name not in end_tags:
+                    section.add(id(element))
                     element = element.next_sibling
 
+                # Remove .navbar divs nested inside this section
+                section_parent = heading.parent
+                for navbar in navbars:
+                    if navbar.decomposed:
+                        continue
+                    for ancestor in navbar.parents:
+                        if ancestor.parent is section_parent:
+                            if id(ancestor) in section:
+                                navbar.decompose()
+                            break
+
     def _create_enhanced_infobox(self, soup, content_type="plants"):
         """Create enhanced infobox with tabs matching the screenshot design"""
 
         # Find portable infobox (the actual structure used by the wiki)
-        infobox = soup.find("aside", class_=re.compile(r"portable-infobox"))
+        infobox = _PORTABLE_INFOBOX_SELECTOR.select_one(soup)
 
         # Fallback to older infobox patterns if portable infobox not found
         if not infobox:
-            infobox = soup.find(["div", "table"], class_=re.compile(r"infobox|pi-item"))
+            infobox = soup.find(["div", "table"], class_=_INFOBOX_FALLBACK_RE)
 
         if not infobox:
             return ""
@@ -227,12 +331,10 @@ class ContentProcessor:
         infobox_data = self._extract_infobox_data(infobox)
 
         # Extract title from portable infobox
-        title_elem = infobox.find("h2", class_=re.compile(r"pi-title"))
+        title_elem = _PI_TITLE_SELECTOR.select_one(infobox)
         if not title_elem:
             # Try alternative title selectors
-            title_elem = infobox.find(
-                ["h1", "h2", "div"], class_=re.compile(r"pi-title|infobox-title")
-            )
+            title_elem = infobox.find(["h1", "h2", "div"], class_=_TITLE_ALT_RE)
 
         if title_elem:
             title_text = title_elem.get_text(strip=True)
@@ -272,44 +374,32 @@ class ContentProcessor:
         # Determine header title based on content type
         header_title = "僵尸图鉴" if content_type == "zombies" else "植物图鉴"
 
-        infobox_html = (
-            """
+        infobox_html = f"""
         <div class="plant-infobox">
             <div class="infobox-header">
-                <div class="header-title">"""
-            + header_title
-            + """</div>
-                <div class="plant-name">"""
-            + title
-            + """</div>
+                <div class="header-title">{header_title}</div>
+                <div class="plant-name">{title}</div>
             </div>
             <div class="plant-image-container">
-                """
-            + image
-            + """
+                {image}
             </div>
             <div class="infobox-sections">
                 <div class="info-section">
                     <div class="section-header">游戏数据</div>
                     <div class="section-content">
-                        """
-            + gamedata_tab
-            + """
+                        {gamedata_tab}
                     </div>
                 </div>
 
                 <div class="info-section">
                     <div class="section-header">名称一览</div>
                     <div class="section-content">
-                        """
-            + names_tab
-            + """
+                        {names_tab}
                     </div>
                 </div>
             </div>
         </div>
         """
-        )
 
         return infobox_html
 
@@ -318,59 +408,46 @@ class ContentProcessor:
         data = {"fields": {}, "tabs": {}}
 
         # Extract individual data fields (for backward compatibility)
-        for pi_data in infobox.find_all("div", class_=re.compile(r"pi-data")):
-            label_elem = pi_data.find("h3", class_=re.compile(r"pi-data-label"))
-            value_elem = pi_data.find("div", class_=re.compile(r"pi-data-value"))
-
-            if label_elem and value_elem:
-                label = label_elem.get_text(strip=True)
-                value = value_elem.get_text(strip=True)
-                data["fields"][label] = value
+        data["fields"] = self._extract_data_fields(infobox)
 
         # Check for tabbed structure
-        tabber = infobox.find("section", class_=re.compile(r"wds-tabber"))
+        tabber = _TABBER_SELECTOR.select_one(infobox)
         if tabber:
             # Extract tab labels
-            tab_labels = tabber.find_all(
-                "div", class_=re.compile(r"wds-tabs__tab-label")
-            )
+            tab_labels = _TAB_LABEL_SELECTOR.select(tabber)
 
             # Extract tab content
-            tab_contents = tabber.find_all(
-                "div", class_=re.compile(r"wds-tab__content")
-            )
+            tab_contents = _TAB_CONTENT_SELECTOR.select(tabber)
 
             # Pair labels with content
-            for i, content in enumerate(tab_contents):
-                if i < len(tab_labels):
-                    tab_label = tab_labels[i].get_text(strip=True)
-                    tab_data = {}
-
-                    # Extract fields from this tab
-                    for pi_data in content.find_all(
-                        "div", class_=re.compile(r"pi-data")
-                    ):
-                        label_elem = pi_data.find(
-                            "h3", class_=re.compile(r"pi-data-label")
-                        )
-                        value_elem = pi_data.find(
-                            "div", class_=re.compile(r"pi-data-value")
-                        )
-
-                        if label_elem and value_elem:
-                            label = label_elem.get_text(strip=True)
-                            value = value_elem.get_text(strip=True)
-                            tab_data[label] = value
-
-                    data["tabs"][tab_label] = tab_data
+            for label_elem, content in zip(tab_labels, tab_contents):
+                tab_label = label_elem.get_text(strip=True)
+                data["tabs"][tab_label] = self._extract_data_fields(content)
+
+        # Locate the names tab once; both infobox sections need it
+        data["names_tab"] = self._find_names_tab(data["tabs"])
 
         return data
 
+    def _extract_data_fields(self, container):
+        """Extract label -> value pairs from the pi-data rows inside container"""
+        fields = {}
+        for pi_data in _PI_DATA_SELECTOR.select(container):
+            label_elem = _PI_LABEL_SELECTOR.select_one(pi_data)
+            if not label_elem:
+                continue
+            value_elem = _PI_VALUE_SELECTOR.select_one(pi_data)
+            if value_elem:
+                fields[label_elem.get_text(strip=True)] = value_elem.get_text(
+                    strip=True
+                )
+        return fields
+
     def _extract_page_title_fallback(self, soup):
         """Extract page title from alternative sources when infobox title fails"""
         # Try to find the main page title
         title_selectors = [
-            ("h1", {"class": re.compile(r"page-header__title|firstHeading")}),
+            ("h1", {"class": _PAGE_TITLE_RE}),
             ("h1", {"id": "firstHeading"}),
             ("h1", None),
         ]
@@ -391,7 +468,7 @@ class ContentProcessor:
     def _find_names_tab(self, tabs):
         """Dynamically find the names tab by looking for tab labels that suggest names"""
         if not tabs:
-            return None
+            return None, None
 
         # First priority: exact matches for common name tab patterns
         for tab_label, tab_data in tabs.items():
@@ -404,9 +481,7 @@ class ContentProcessor:
                 continue
             # If most fields contain name-related characters, likely a names tab
             name_field_count = sum(
-                1
-                for field in tab_data.keys()
-                if any(char in field for char in ["名", "英", "中", "文", "日"])
+                1 for field in tab_data.keys() if _NAME_CHARS_RE.search(field)
             )
             if name_field_count >= len(tab_data) * 0.5:  # At least 50% are name fields
                 return tab_label, tab_data
@@ -418,6 +493,7 @@ class ContentProcessor:
         fields = data.get("fields", {})
         tabs = data.get("tabs", {})
 
+        names_tab = data["names_tab"]
         target_tab = None
 
         # Strategy: Use the 2nd tab (index 1) if there are multiple tabs
@@ -451,7 +527,7 @@ class ContentProcessor:
         # Another fallback: Find any non-names tab
         if not target_tab:
             # Find the names tab first so we can exclude it
-            names_tab_label, names_tab_data = self._find_names_tab(tabs)
+            names_tab_label, names_tab_data = names_tab
             names_tab_fields = set(names_tab_data.keys()) if names_tab_data else set()
 
             # Now find a tab that's not the names tab
@@ -470,7 +546,7 @@ class ContentProcessor:
 
         # For flat fields, exclude any fields that appear to be from names tab
         if target_tab == fields and tabs:
-            names_tab_label, names_tab_data = self._find_names_tab(tabs)
+            names_tab_label, names_tab_data = names_tab
             if names_tab_data:
                 names_fields = set(names_tab_data.keys())
                 target_tab = {k: v for k, v in fields.items() if k not in names_fields}
@@ -491,12 +567,10 @@ class ContentProcessor:
 
     def _create_names_tab(self, data):
         """Create the names tab content with real data"""
-        fields = data.get("fields", {})
-        tabs = data.get("tabs", {})
-        title = data.get("title", "")
+        names_tab = data["names_tab"]
 
         # Extract names using dynamic tab detection
-        names = self._extract_names_from_data(fields, title, tabs)
+        names = self._extract_names_from_data(names_tab[1])
 
         name_rows = []
 
@@ -512,57 +586,43 @@ class ContentProcessor:
 
         return "\n".join(name_rows)
 
-    def _extract_names_from_data(self, fields, title, tabs=None):
-        """Extract name information from data, now supporting dynamic tab detection"""
-        names = {}
-
-        # Look for dedicated names tab first
-        if tabs:
-            names_tab_label, names_tab_data = self._find_names_tab(tabs)
-
-            # If found names tab, use all its contents
-            if names_tab_data:
-                names.update(names_tab_data)
-                return names
-
+    def _extract_names_from_data(self, names_tab_data):
+        """Extract name information from the detected names tab"""
         # For non-tabbed infoboxes, just return empty dict
         # We won't try to guess which fields are names
-        return names
+        return dict(names_tab_data) if names_tab_data else {}
 
     def _remove_svg_icons(self, soup):
         """Remove SVG icons from figure captions that cause spacing issues"""
 
         # Remove all SVG elements in figure captions
-        for svg in soup.select("figure.thumb svg"):
+        for svg in _FIGURE_SVG_SELECTOR.select(soup):
             svg.decompose()
 
         # Remove info-icon elements
-        for info_icon in soup.select("figure.thumb .info-icon"):
+        for info_icon in _FIGURE_INFO_ICON_SELECTOR.select(soup):
             info_icon.decompose()
 
         # Remove any a tags that only contained icons
-        for link in soup.select("figure.thumb figcaption a"):
+        for link in _FIGURE_CAPTION_LINK_SELECTOR.select(soup):
             if not link.get_text(strip=True):
                 link.decompose()
 
-    def _clean_toc_entries(self, soup):
+    def _clean_toc_entries(self, toc):
         """Remove TOC entries for sections that have been removed and renumber"""
-        removed_sections = ["衍生内容", "图库"]
-
-        # Find the TOC
-        toc = soup.find("div", {"id": "toc"})
-        if not toc:
-            return
-
-        # Remove TOC entries for removed sections
-        for section_title in removed_sections:
-            for link in toc.find_all("a"):
-                span = link.find("span", class_="toctext")
-                if span and section_title in span.get_text(strip=True):
-                    # Remove the entire li element containing this link
-                    li_elem = link.find_parent("li")
-                    if li_elem:
-                        li_elem.decompose()
+        # Remove TOC entries for removed sections in a single pass over the links
+        for link in toc.find_all("a"):
+            if link.decomposed:
+                continue
+            span = link.find("span", class_="toctext")
+            if span is None:
+                continue
+            text = span.get_text(strip=True)
+            if any(section_title in text for section_title in _REMOVED_SECTION_TITLES):
+                # Remove the entire li element containing this link
+                li_elem = link.find_parent("li")
+                if li_elem:
+                    li_elem.decompose()
 
         # Renumber the remaining TOC entries
         self._renumber_toc(toc)
@@ -585,28 +645,13 @@ class ContentProcessor:
                 if sub_tocnumber:
                     sub_tocnumber.string = f"{i}.{j}"
 
-    def _remove_mediawiki_comments(self, soup):
+    def _remove_mediawiki_comments(self, comments):
         """Remove MediaWiki performance and debug comments like NewPP limit report"""
-        from bs4 import Comment
-
-        # Find all HTML comments
-        comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-
         for comment in comments:
+            # Skip comments that went away with a removed section
+            if comment.decomposed:
+                continue
             comment_text = str(comment).strip()
             # Remove MediaWiki performance and debug comments
-            if any(
-                keyword in comment_text
-                for keyword in [
-                    "NewPP limit report",
-                    "Transclusion expansion time report",
-                    "Saved in parser cache",
-                    "CPU time usage:",
-                    "Real time usage:",
-                    "Preprocessor visited node count:",
-                    "Template argument size:",
-                    "Lua time usage:",
-                    "Lua memory usage:",
-                ]
-            ):
+            if _MEDIAWIKI_COMMENT_RE.search(comment_text):
                 comment.extract()
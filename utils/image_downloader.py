@@ -4,37 +4,140 @@ Image Downloader Module
 Handles downloading and processing images from wiki pages
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urljoin, urlparse, unquote
+import atexit
+import functools
 import hashlib
+import threading
 import time
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import json
 import os
 
+# Cheap probe for image tags, so image-less content skips the HTML parse
+_IMG_TAG_RE = re.compile(r"<img", re.IGNORECASE)
+
+# Path segments stripped from image URLs to compare different renditions
+_SCALE_RE = re.compile(r"/scale-to-width-down/\d+")
+_REVISION_RE = re.compile(r"/revision/latest.*")
+
+# Extension sanitization: unsafe characters become underscores, then runs of
+# underscores and whitespace collapse into one underscore
+_UNSAFE_FILENAME_TABLE = str.maketrans(dict.fromkeys('<>:"/\\|?*', "_"))
+_UNDERSCORE_RUN_RE = re.compile(r"[_\s]+")
+
+# Bytes read from the response per write while downloading an image
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of distinct URLs kept in the URL normalization caches
+URL_CACHE_SIZE = 4096
+
+
+def _write_json_atomic(path, data, **dump_kwargs):
+    """Write JSON to a temp file and swap it into place
+
+    An interrupted write leaves the previous file intact instead of a
+    truncated one.
+    """
+    temp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _get_image_base_url(url):
+    """Extract base image URL without scaling parameters and query string"""
+    if not url:
+        return url
+
+    # Remove query parameters
+    base_url = url.split("?")[0]
+
+    # Remove scaling parameters like /scale-to-width-down/150
+    base_url = _SCALE_RE.sub("", base_url)
+    base_url = _REVISION_RE.sub("/revision/latest", base_url)
+
+    return base_url
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _get_base_url(url):
+    """Extract base URL from a full URL"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _url_path_filename(url):
+    """Return the decoded last path segment of a URL"""
+    return Path(unquote(urlparse(url).path)).name
+
 
 class ImageDownloader:
     """Handles downloading and processing images from wiki content"""
 
-    def __init__(self, session, output_dir, base_url=""):
+    def __init__(self, session, output_dir, base_url="", revalidate=False):
         self.session = session
         self.output_dir = Path(output_dir)
         self.images_dir = self.output_dir / "images"
         self.images_dir.mkdir(exist_ok=True)
         self.base_url = base_url
+        # Re-check cached images with conditional GETs instead of trusting them
+        self.revalidate = revalidate
+        # URLs already re-checked this session, served from cache after that
+        self._revalidated_urls = set()
         self.downloaded_images = {}  # URL -> local_path mapping
-        self.download_delay = 0.5  # Delay between downloads to be respectful
+        self.download_delay = 0.5  # Minimum delay between requests to one host
+        self.max_workers = 8  # Images downloaded concurrently per page
+        # Guards the mappings and file renames shared by download threads
+        self._lock = threading.Lock()
+        # Earliest time the next request to each host may start
+        self._host_next_request = {}
+        self._rate_lock = threading.Lock()
+
+        # Keep enough pooled keep-alive connections for every download thread
+        # so images from the same CDN host reuse TCP/TLS connections, and
+        # retry transient server errors with backoff
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.max_workers * 2,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
         # File to store persistent URL -> filename mapping
         self.url_mapping_file = self.images_dir / ".url_mapping.json"
         self.content_hash_file = self.images_dir / ".content_hashes.json"
+        # ETag / Last-Modified per URL, sent back when revalidating
+        self.url_validator_file = self.images_dir / ".url_validators.json"
 
         # Load existing mappings
         self._load_mappings()
 
+        # Mappings are saved once per page by flush() rather than after every
+        # download; the exit hook saves anything left from an interrupted page
+        self._dirty = False
+        atexit.register(self.flush)
+
     def _load_mappings(self):
         """Load existing URL mappings and content hashes from files"""
+        # List the images directory once instead of stat-ing every mapped file
+        with os.scandir(self.images_dir) as entries:
+            existing_files = {entry.name for entry in entries if entry.is_file()}
+
         # Load URL mappings
         if self.url_mapping_file.exists():
             try:
@@ -42,9 +145,8 @@ class ImageDownloader:
                     url_mappings = json.load(f)
                     # Convert to Path objects and verify files still exist
                     for url, filename in url_mappings.items():
-                        file_path = self.images_dir / filename
-                        if file_path.exists():
-                            self.downloaded_images[url] = file_path
+                        if filename in existing_files:
+                            self.downloaded_images[url] = self.images_dir / filename
                 print(f"Loaded {len(self.downloaded_images)} existing mappings")
             except (json.JSONDecodeError, Exception) as e:
                 print(f"Warning: Could not load URL mappings: {e}")
@@ -54,11 +156,31 @@ class ImageDownloader:
         if self.content_hash_file.exists():
             try:
                 with open(self.content_hash_file, "r", encoding="utf-8") as f:
-                    self.content_hashes = json.load(f)
+                    content_hashes = json.load(f)
+                # Drop hashes whose files have been deleted
+                self.content_hashes = {
+                    content_hash: filename
+                    for content_hash, filename in content_hashes.items()
+                    if filename in existing_files
+                }
                 print(f"Loaded {len(self.content_hashes)} content hashes")
             except (json.JSONDecodeError, Exception) as e:
                 print(f"Warning: Could not load content hashes: {e}")
 
+        # Load cache validators for URLs that still have a file
+        self.url_validators = {}
+        if self.url_validator_file.exists():
+            try:
+                with open(self.url_validator_file, "r", encoding="utf-8") as f:
+                    url_validators = json.load(f)
+                self.url_validators = {
+                    url: validators
+                    for url, validators in url_validators.items()
+                    if url in self.downloaded_images
+                }
+            except (json.JSONDecodeError, Exception) as e:
+                print(f"Warning: Could not load URL validators: {e}")
+
     def _save_mappings(self):
         """Save URL mappings and content hashes to files"""
         # Save URL mappings
@@ -66,85 +188,152 @@ class ImageDownloader:
             url_mappings = {
                 url: path.name for url, path in self.downloaded_images.items()
             }
-            with open(self.url_mapping_file, "w", encoding="utf-8") as f:
-                json.dump(url_mappings, f, indent=2, ensure_ascii=False)
+            _write_json_atomic(
+                self.url_mapping_file, url_mappings, indent=2, ensure_ascii=False
+            )
         except Exception as e:
             print(f"Warning: Could not save URL mappings: {e}")
 
         # Save content hashes
         try:
-            with open(self.content_hash_file, "w", encoding="utf-8") as f:
-                json.dump(self.content_hashes, f, indent=2)
+            # Hash -> filename pairs are not meant to be read by hand, so keep the
+            # file compact; it grows with every new image
+            _write_json_atomic(
+                self.content_hash_file, self.content_hashes, separators=(",", ":")
+            )
         except Exception as e:
             print(f"Warning: Could not save content hashes: {e}")
 
+        # Save cache validators; like the content hashes this file is only
+        # read by the downloader and grows with every image, so keep it compact
+        try:
+            _write_json_atomic(
+                self.url_validator_file,
+                self.url_validators,
+                separators=(",", ":"),
+                ensure_ascii=False,
+            )
+        except Exception as e:
+            print(f"Warning: Could not save URL validators: {e}")
+
+    def flush(self):
+        """Save the mappings if any download changed them since the last save"""
+        with self._lock:
+            if self._dirty:
+                self._save_mappings()
+                self._dirty = False
+
+    def verify_cache(self):
+        """Re-hash every image on disk and rebuild the content hash map
+
+        Files are hashed on a thread pool; hashlib releases the GIL while
+        hashing, so reads and hashing overlap across files.
+        """
+        with os.scandir(self.images_dir) as entries:
+            filenames = sorted(
+                entry.name
+                for entry in entries
+                if entry.is_file() and not entry.name.startswith((".", "temp_"))
+            )
+
+        print(f"Verifying {len(filenames)} cached images...")
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            file_hashes = executor.map(
+                self._calculate_file_hash,
+                (self.images_dir / filename for filename in filenames),
+            )
+            hashed_files = list(zip(filenames, file_hashes))
+
+        with self._lock:
+            # Keep the recorded name for each hash when that file still matches
+            recorded = self.content_hashes
+            content_hashes = {}
+            for filename, content_hash in hashed_files:
+                if content_hash is None:
+                    continue
+                if (
+                    content_hash not in content_hashes
+                    or recorded.get(content_hash) == filename
+                ):
+                    content_hashes[content_hash] = filename
+
+            # Count each hash once whether it was added, removed or remapped
+            changed = sum(
+                recorded.get(content_hash) != content_hashes.get(content_hash)
+                for content_hash in recorded.keys() | content_hashes.keys()
+            )
+            self.content_hashes = content_hashes
+            self._dirty = True
+
+        self.flush()
+        print(
+            f"Verified {len(content_hashes)} unique images "
+            f"({changed} content hash entries updated)"
+        )
+        return content_hashes
+
     def _calculate_file_hash(self, file_path):
         """Calculate SHA256 hash of a file"""
-        sha256_hash = hashlib.sha256()
         try:
+            # file_digest reads in large blocks without holding the GIL
             with open(file_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            return sha256_hash.hexdigest()
+                return hashlib.file_digest(f, "sha256").hexdigest()
         except Exception:
             return None
 
     def _find_existing_file_by_content(self, content_hash):
         """Find existing file with the same content hash"""
-        for existing_hash, filename in self.content_hashes.items():
-            if existing_hash == content_hash:
-                file_path = self.images_dir / filename
-                if file_path.exists():
-                    return file_path
+        filename = self.content_hashes.get(content_hash)
+        if filename:
+            file_path = self.images_dir / filename
+            if file_path.exists():
+                return file_path
         return None
 
     def process_images_in_html(self, html_content, page_url=""):
         """Process all images in HTML content and download them"""
-        if not html_content:
+        # Content without images needs no parse and serialize round trip
+        if not html_content or not _IMG_TAG_RE.search(html_content):
             return html_content
 
         soup = BeautifulSoup(html_content, "lxml")
         images = soup.find_all("img")
 
         if not images:
-            return str(soup)
+            return html_content
 
         print(f"Found {len(images)} images to process...")
 
-        # Keep track of URL mappings for updating links later
-        url_mappings = {}
-
+        # Resolve every image URL first so each unique image is fetched once
+        image_urls = []
         for img in images:
-            src = img.get("src")
-            data_src = img.get("data-src")
-
-            # Prefer data-src (lazy loading) over src
-            if data_src:
-                src = data_src
-
-            if not src:
-                continue
+            src = self._resolve_image_url(img, page_url)
+            if src:
+                image_urls.append((img, src))
+
+        # Images already in the cache resolve right away; only the remaining
+        # unique URLs are handed to the download pool
+        unique_urls = dict.fromkeys(src for _, src in image_urls)
+        cached_urls = self._revalidated_urls if self.revalidate else self.downloaded_images
+        local_paths = {
+            src: self._download_image(src) for src in unique_urls if src in cached_urls
+        }
+        pending_urls = [src for src in unique_urls if src not in local_paths]
+
+        # Download the rest concurrently; network latency overlaps while the
+        # per-host rate limit keeps requests polite
+        if pending_urls:
+            workers = min(self.max_workers, len(pending_urls))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                local_paths.update(
+                    zip(pending_urls, executor.map(self._download_image, pending_urls))
+                )
 
-            # Skip data URLs, SVGs, or already local images
-            if (
-                src.startswith("data:")
-                or src.startswith("./images/")
-                or src.endswith(".svg")
-            ):
-                continue
+        # Keep track of URL mappings for updating links later
+        url_mappings = {}
 
-            # Convert relative URLs to absolute
-            if src.startswith("//"):
-                src = "https:" + src
-            elif src.startswith("/"):
-                if page_url:
-                    base = self._get_base_url(page_url)
-                    src = urljoin(base, src)
-                elif self.base_url:
-                    src = urljoin(self.base_url, src)
-
-            # Download and update src
-            local_path = self._download_image(src)
+        for img, src in image_urls:
+            local_path = local_paths[src]
             if local_path:
                 # Update src to relative path
                 relative_path = f"./images/{local_path.name}"
@@ -157,121 +346,196 @@ class ImageDownloader:
             else:
                 print(f"  ❌ Failed to download: {src}")
 
+        # Persist all of this page's new mappings in one write
+        self.flush()
+
+        # Nothing was rewritten, so the original markup can be returned as is
+        if not url_mappings:
+            return html_content
+
         # Update image links (a tags with href pointing to images)
         self._update_image_links(soup, url_mappings)
 
         return str(soup)
 
+    def _resolve_image_url(self, img, page_url=""):
+        """Return the absolute URL to download for an img tag, or None to skip it"""
+        src = img.get("src")
+        data_src = img.get("data-src")
+
+        # Prefer data-src (lazy loading) over src
+        if data_src:
+            src = data_src
+
+        if not src:
+            return None
+
+        # Skip data URLs, SVGs, or already local images
+        if (
+            src.startswith("data:")
+            or src.startswith("./images/")
+            or src.endswith(".svg")
+        ):
+            return None
+
+        # Convert relative URLs to absolute
+        if src.startswith("//"):
+            src = "https:" + src
+        elif src.startswith("/"):
+            if page_url:
+                base = _get_base_url(page_url)
+                src = urljoin(base, src)
+            elif self.base_url:
+                src = urljoin(self.base_url, src)
+
+        return src
+
     def _update_image_links(self, soup, url_mappings):
         """Update href attributes in image links to point to local files"""
         # Find all links that might point to images
         links = soup.find_all("a", href=True)
 
+        # Index the downloaded images by base URL so each link is matched with
+        # one lookup; an exact URL match always shares its base URL, and the
+        # first image registered for a base wins as before
+        base_to_local = {}
+        for original_url, local_path in url_mappings.items():
+            base_to_local.setdefault(_get_image_base_url(original_url), local_path)
+
         for link in links:
             href = link.get("href")
             if not href:
                 continue
 
-            # Check if this href matches any of our downloaded images
-            for original_url, local_path in url_mappings.items():
-                # Direct match
-                if href == original_url:
-                    link["href"] = local_path
-                    break
-
-                # Extract base URLs without query parameters and scaling
-                href_base = self._get_image_base_url(href)
-                original_base = self._get_image_base_url(original_url)
-
-                if href_base == original_base:
-                    link["href"] = local_path
-                    break
-
-    def _get_image_base_url(self, url):
-        """Extract base image URL without scaling parameters and query string"""
-        if not url:
-            return url
+            local_path = base_to_local.get(_get_image_base_url(href))
+            if local_path:
+                link["href"] = local_path
 
-        # Remove query parameters
-        base_url = url.split("?")[0]
+    def _wait_for_host(self, url):
+        """Block until download_delay has passed since the host's last request
 
-        # Remove scaling parameters like /scale-to-width-down/150
-        import re
+        Requests to a host that has been quiet go out at once. Concurrent
+        threads each reserve the next free slot, so a host never sees more
+        than one request per download_delay.
+        """
+        if self.download_delay <= 0:
+            return
 
-        base_url = re.sub(r"/scale-to-width-down/\d+", "", base_url)
-        base_url = re.sub(r"/revision/latest.*", "/revision/latest", base_url)
+        host = _get_base_url(url)
+        with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._host_next_request.get(host, now))
+            self._host_next_request[host] = start + self.download_delay
 
-        return base_url
+        if start > now:
+            time.sleep(start - now)
 
     def _download_image(self, url):
         """Download a single image and return local path"""
         # Check if already downloaded by URL
-        if url in self.downloaded_images:
-            existing_path = self.downloaded_images[url]
-            if existing_path.exists():
-                print(f"  ♻️  Using cached: {url} -> {existing_path.name}")
-                return existing_path
-            else:
-                # File was deleted, remove from cache
-                del self.downloaded_images[url]
+        cached_path = None
+        with self._lock:
+            existing_path = self.downloaded_images.get(url)
+            if existing_path is not None:
+                if existing_path.exists():
+                    if not self.revalidate or url in self._revalidated_urls:
+                        print(f"  ♻️  Using cached: {url} -> {existing_path.name}")
+                        return existing_path
+                    cached_path = existing_path
+                else:
+                    # File was deleted, remove from cache
+                    del self.downloaded_images[url]
+                    self.url_validators.pop(url, None)
+                    self._dirty = True
+
+        # Ask the server to skip the body if the cached copy is still current
+        headers = {}
+        if cached_path is not None:
+            validators = self.url_validators.get(url, {})
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
 
         try:
-            # Add delay to be respectful
-            time.sleep(self.download_delay)
+            # Wait for the host's rate limit to be respectful
+            self._wait_for_host(url)
 
             print(f"  📥 Downloading: {url}")
-            response = self.session.get(url, timeout=30, stream=True)
+            response = self.session.get(url, timeout=30, stream=True, headers=headers)
+            if response.status_code == 304 and cached_path is not None:
+                response.close()
+                with self._lock:
+                    self._revalidated_urls.add(url)
+                print(f"  ♻️  Not modified: {url} -> {cached_path.name}")
+                return cached_path
             response.raise_for_status()
 
-            # Download to temporary location first to check content hash
-            temp_filename = f"temp_{int(time.time())}_{os.getpid()}"
+            # Download to temporary location first to check content hash; the
+            # thread id keeps concurrent downloads from sharing a temp file
+            temp_filename = (
+                f"temp_{int(time.time())}_{os.getpid()}_{threading.get_ident()}"
+            )
             temp_path = self.images_dir / temp_filename
 
-            # Download and save to temp file
+            # Download and save to temp file, hashing the content as it streams
+            # so the file never has to be read back
+            # Reading the raw stream in large blocks skips iter_content's
+            # per-chunk generator overhead; decode_content still un-gzips
+            sha256_hash = hashlib.sha256()
             with open(temp_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
+                for chunk in iter(
+                    lambda: response.raw.read(DOWNLOAD_CHUNK_SIZE, decode_content=True),
+                    b"",
+                ):
+                    sha256_hash.update(chunk)
                     f.write(chunk)
-
-            # Calculate content hash
-            content_hash = self._calculate_file_hash(temp_path)
-            if content_hash:
-                # Check if we already have this exact content
+            content_hash = sha256_hash.hexdigest()
+
+            # Deduplicate, name and register the file while holding the lock
+            # so concurrent downloads cannot claim the same hash
+            with self._lock:
+                # Remember the validators for conditional requests next time
+                validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                if any(validators.values()):
+                    self.url_validators[url] = validators
+                else:
+                    self.url_validators.pop(url, None)
+                self._revalidated_urls.add(url)
+
+                # Check if we already have this exact content, including files
+                # saved under URL-derived names before content addressing
                 existing_file = self._find_existing_file_by_content(content_hash)
                 if existing_file:
                     # Remove temp file and use existing one
                     temp_path.unlink()
                     self.downloaded_images[url] = existing_file
-                    self._save_mappings()
+                    self._dirty = True
                     print(f"  🔗 Duplicate content found, using: {existing_file.name}")
                     return existing_file
 
-            # Generate safe filename for the new file
-            filename = self._generate_filename(url, response.headers)
-            local_path = self.images_dir / filename
-
-            # Avoid overwriting existing files by name
-            counter = 1
-            original_stem = local_path.stem
-            while local_path.exists():
-                local_path = self.images_dir / (
-                    f"{original_stem}_{counter}{local_path.suffix}"
-                )
-                counter += 1
-
-            # Move temp file to final location
-            temp_path.rename(local_path)
+                # Name the file after its content, so a file already at that
+                # path holds the same image and no collision loop is needed
+                extension = self._image_extension(url, response.headers)
+                local_path = self.images_dir / f"image_{content_hash[:16]}{extension}"
+                if local_path.exists():
+                    temp_path.unlink()
+                else:
+                    os.replace(temp_path, local_path)
 
-            # Cache the result
-            self.downloaded_images[url] = local_path
+                # Cache the result
+                self.downloaded_images[url] = local_path
 
-            # Store content hash
-            if content_hash:
+                # Store content hash
                 self.content_hashes[content_hash] = local_path.name
 
-            # Save mappings
-            self._save_mappings()
+                # Mark mappings for saving at the end of the page
+                self._dirty = True
 
-            return local_path
+                return local_path
 
         except Exception as e:
             print(f"  ⚠️  Error downloading {url}: {e}")
@@ -283,61 +547,23 @@ class ImageDownloader:
                     pass
             return None
 
-    def _generate_filename(self, url, headers=None):
-        """Generate a safe filename for the image"""
-        # Parse URL
-        parsed = urlparse(url)
-        path = unquote(parsed.path)
-
-        # Extract filename from URL
-        filename = Path(path).name
-
-        # If no filename, generate one from URL hash
-        if not filename or "." not in filename:
-            url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-
-            # Try to get extension from content-type
-            extension = ".jpg"  # default
-            if headers:
-                content_type = headers.get("content-type", "").lower()
-                if "png" in content_type:
-                    extension = ".png"
-                elif "gif" in content_type:
-                    extension = ".gif"
-                elif "webp" in content_type:
-                    extension = ".webp"
-
-            filename = f"image_{url_hash}{extension}"
-
-        # Clean filename
-        filename = self._sanitize_filename(filename)
-
-        # Ensure we have a valid extension
-        if not Path(filename).suffix:
-            filename += ".jpg"
-
-        return filename
-
-    def _sanitize_filename(self, filename):
-        """Sanitize filename for safe filesystem storage"""
-        # Remove unsafe characters
-        filename = re.sub(r'[<>:"/\\|?*]', "_", filename)
-
-        # Remove multiple consecutive underscores/spaces
-        filename = re.sub(r"[_\s]+", "_", filename)
-
-        # Limit length
-        if len(filename) > 100:
-            stem = Path(filename).stem[:80]
-            suffix = Path(filename).suffix
-            filename = stem + suffix
-
-        return filename
-
-    def _get_base_url(self, url):
-        """Extract base URL from a full URL"""
-        parsed = urlparse(url)
-        return f"{parsed.scheme}://{parsed.netloc}"
+    def _image_extension(self, url, headers=None):
+        """Pick the file extension for an image from its URL or Content-Type"""
+        # Use the extension from the URL's filename when it has one
+        extension = Path(_url_path_filename(url)).suffix
+        if extension:
+            extension = extension.translate(_UNSAFE_FILENAME_TABLE)
+            return _UNDERSCORE_RUN_RE.sub("_", extension)
+
+        # Otherwise try to get extension from content-type
+        content_type = headers.get("content-type", "").lower() if headers else ""
+        if "png" in content_type:
+            return ".png"
+        elif "gif" in content_type:
+            return ".gif"
+        elif "webp" in content_type:
+            return ".webp"
+        return ".jpg"  # default
 
     def get_download_stats(self):
         """Return statistics about downloaded images"""